@@ -11,12 +11,64 @@ import sys
 import time
 import json
 import signal
+import socket
+import http.client
 import logging
+import logging.handlers
+import threading
+import functools
+import shutil
 import subprocess
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from dataclasses import dataclass
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
+# Networking stack, imported once at startup; installed on demand by ensure_dependencies
+requests = socks = HTTPAdapter = None
+
+def _load_dependencies() -> bool:
+    """Import requests/PySocks into module globals, returning whether they are available"""
+    global requests, socks, HTTPAdapter
+    try:
+        import requests
+        import socks
+        from requests.adapters import HTTPAdapter
+    except ImportError:
+        return False
+    return True
+
+_DEPS_OK = _load_dependencies()
+
+# stem is optional, it only improves ControlPort authentication
+try:
+    from stem import Signal
+    from stem.control import Controller
+except ImportError:
+    Signal = Controller = None
+
+# Static console text, built once at import time
+_BANNER = """
+╔════════════════════════════════════════════════════════════════╗
+║              🔒 AnonymityEngine v2.0                           ║
+║           Advanced Tor IP Rotation Tool                       ║
+╠════════════════════════════════════════════════════════════════╣
+║  • Professional-grade reliability                             ║
+║  • Multiple IP verification services                          ║
+║  • Graceful shutdown support                                  ║
+║  • Comprehensive logging & monitoring                         ║
+║  • Enterprise-level security                                  ║
+╚════════════════════════════════════════════════════════════════╝
+
+"""
+
+_CONFIG_TEMPLATE = (
+    "\n🔧 Configuration:\n"
+    "├─ SOCKS proxy: 127.0.0.1:{socks_port}\n"
+    "├─ Configure your browser/applications to use this proxy\n"
+    "└─ Press Ctrl+C to stop gracefully\n\n"
+)
 
 # Configuration class
 @dataclass
@@ -31,6 +83,12 @@ class TorConfig:
     min_interval: int = 10
     max_interval: int = 3600
 
+@functools.lru_cache(maxsize=32)
+def _resolve_json_ip(text: str) -> str:
+    """Extract the IP from a JSON payload (services return the same body repeatedly)"""
+    data = json.loads(text)
+    return data.get('origin', '').split(',')[0].strip()
+
 class TorIPChanger:
     """Main class for managing Tor IP changes"""
     
@@ -46,7 +104,29 @@ class TorIPChanger:
         self.current_ip = None
         self.requests = None
         self.session = None
+        # The proxy endpoint never changes, build it once
+        self._socks_url = f'socks5h://127.0.0.1:{self.config.socks_port}'
+        self._proxies = {
+            'http': self._socks_url,
+            'https': self._socks_url
+        }
+        # Index of the last service that answered, tried first on the next check
+        self._preferred_service_idx = 0
+        # Shared pool used to query the IP check services concurrently
+        self._executor = ThreadPoolExecutor(max_workers=len(self.ip_check_services))
         self.running = False
+        self._stop_event = threading.Event()
+        self._system_info = None
+        self._tor_bin = None
+        # ControlPort connection, opened lazily on the first IP change
+        self._controller = None
+        self._control_sock = None
+        # Reload commands for this host, ordered by initialize(); the one that works moves first
+        self._reload_methods = []
+        # Kept-alive HTTP connections for the plain HTTP IP checks, keyed by (host, port)
+        self._raw_conns = {}
+        # Bumped on every IP change so connections from an older circuit are never pooled again
+        self._raw_generation = 0
         
         # Setup signal handlers for graceful shutdown
         signal.signal(signal.SIGINT, self._signal_handler)
@@ -55,56 +135,89 @@ class TorIPChanger:
     def setup_logging(self):
         """Setup logging configuration"""
         log_format = '%(asctime)s - %(levelname)s - %(message)s'
+        # Rotate the log file and batch records so each line is not a separate write
+        file_handler = logging.handlers.RotatingFileHandler('/tmp/anonymity_engine.log',
+                                                            maxBytes=1 << 20, backupCount=3,
+                                                            delay=True)
+        file_handler.setFormatter(logging.Formatter(log_format))
+        buffered_handler = logging.handlers.MemoryHandler(64, flushLevel=logging.ERROR,
+                                                          target=file_handler)
         logging.basicConfig(
             level=getattr(logging, self.config.log_level),
             format=log_format,
             handlers=[
                 logging.StreamHandler(sys.stdout),
-                logging.FileHandler('/tmp/anonymity_engine.log')
+                buffered_handler
             ]
         )
         self.logger = logging.getLogger(__name__)
+        # Checked once so the hottest debug sites skip the call entirely
+        self._debug_enabled = self.logger.isEnabledFor(logging.DEBUG)
     
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals gracefully"""
         self.logger.info(f"Received signal {signum}, shutting down gracefully...")
         self.running = False
+        self._stop_event.set()
     
     def ensure_dependencies(self) -> bool:
         """Ensure all required dependencies are installed"""
+        global _DEPS_OK
         try:
-            # Try to import requests
-            import requests
-            self.requests = requests
-            
-            # Create a session for connection reuse
-            self.session = requests.Session()
-            
-            # Verify socks support
-            try:
-                import socks
-                self.logger.info("✓ All Python dependencies are available")
-                return True
-            except ImportError:
+            # Only fall back to pip when the startup import failed
+            if not _DEPS_OK:
                 self.logger.info("Installing requests[socks]...")
                 result = subprocess.run([
                     sys.executable, '-m', 'pip', 'install', 'requests[socks]'
                 ], capture_output=True, text=True, timeout=60)
                 
-                if result.returncode == 0:
-                    import requests
-                    self.requests = requests
-                    self.session = requests.Session()
-                    self.logger.info("✓ Dependencies installed successfully")
-                    return True
-                else:
+                if result.returncode != 0 or not _load_dependencies():
                     self.logger.error(f"Failed to install dependencies: {result.stderr}")
                     return False
+                _DEPS_OK = True
+                self.logger.info("✓ Dependencies installed successfully")
+            else:
+                self.logger.info("✓ All Python dependencies are available")
+            
+            self.requests = requests
+            
+            # Create a session for connection reuse
+            self.session = self._create_session()
+            return True
                     
         except Exception as e:
             self.logger.error(f"Error ensuring dependencies: {e}")
             return False
     
+    def _create_session(self):
+        """Create a session with pooled adapters so SOCKS connections are reused"""
+        session = self.requests.Session()
+        session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+        session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0))
+        # Route everything through Tor at the session level so pooled SOCKS connections are kept alive
+        session.proxies.update(self._proxies)
+        # Without this, http_proxy/https_proxy/all_proxy from the environment override session.proxies
+        session.trust_env = False
+        session.headers['Connection'] = 'keep-alive'
+        return session
+    
+    def _probe_system(self) -> Dict[str, Any]:
+        """Collect Tor path, Tor service state and uid with a single subprocess"""
+        # The binary lookup is a pure $PATH walk and the uid is known in-process,
+        # so systemctl is the only process that needs to run
+        self._tor_bin = shutil.which('tor')
+        info = {'tor_path': self._tor_bin, 'tor_active': '', 'uid': os.geteuid()}
+        
+        try:
+            result = subprocess.run(['systemctl', 'is-active', self.config.tor_service_name],
+                                    capture_output=True, text=True, timeout=30)
+            info['tor_active'] = result.stdout.strip()
+        except Exception as e:
+            self.logger.debug("System probe failed: %s", e)
+        
+        self._system_info = info
+        return info
+    
     def check_system_requirements(self) -> bool:
         """Check if system requirements are met"""
         # Check if running on Linux
@@ -113,47 +226,32 @@ class TorIPChanger:
             return False
         
         # Check if Tor is installed
-        try:
-            result = subprocess.run(['which', 'tor'], 
-                                  capture_output=True, text=True)
-            if result.returncode != 0:
-                self.logger.error("❌ Tor is not installed")
-                self.logger.info("Please install Tor: sudo apt-get install tor")
-                return False
-            
-            self.logger.info("✓ Tor is installed")
-            return True
-            
-        except Exception as e:
-            self.logger.error(f"Error checking Tor installation: {e}")
+        info = self._system_info or self._probe_system()
+        if not info['tor_path']:
+            self.logger.error("❌ Tor is not installed")
+            self.logger.info("Please install Tor: sudo apt-get install tor")
             return False
+        
+        self.logger.info("✓ Tor is installed")
+        return True
     
     def check_permissions(self) -> bool:
         """Check if we have necessary permissions"""
-        # Check if we can control systemctl (might need sudo)
-        try:
-            result = subprocess.run(['systemctl', 'is-active', self.config.tor_service_name],
-                                  capture_output=True, text=True)
+        # systemctl answered the probe, or we are root and can control it anyway
+        info = self._system_info or self._probe_system()
+        if info['tor_active'] or info['uid'] == 0:
             return True
-        except subprocess.CalledProcessError:
-            # Try with sudo
-            try:
-                result = subprocess.run(['sudo', '-n', 'systemctl', 'is-active', self.config.tor_service_name],
-                                      capture_output=True, text=True)
-                self.logger.info("✓ Sudo access available for systemctl")
-                return True
-            except subprocess.CalledProcessError:
-                self.logger.warning("⚠️  Limited permissions - some features may not work")
-                return True  # Continue anyway, might work without systemctl
+        
+        self.logger.warning("⚠️  Limited permissions - some features may not work")
+        return True  # Continue anyway, might work without systemctl
     
     def ensure_tor_running(self) -> bool:
         """Ensure Tor service is running"""
         try:
             # Check if Tor is active
-            result = subprocess.run(['systemctl', 'is-active', self.config.tor_service_name],
-                                  capture_output=True, text=True)
+            info = self._system_info or self._probe_system()
             
-            if result.returncode == 0 and result.stdout.strip() == 'active':
+            if info['tor_active'] == 'active':
                 self.logger.info("✓ Tor service is running")
                 return True
             
@@ -163,6 +261,7 @@ class TorIPChanger:
                 subprocess.run(['sudo', 'systemctl', 'start', self.config.tor_service_name],
                              check=True, timeout=30)
                 time.sleep(3)  # Give it time to start
+                info['tor_active'] = 'active'
                 self.logger.info("✓ Tor service started successfully")
                 return True
             except subprocess.CalledProcessError:
@@ -170,6 +269,7 @@ class TorIPChanger:
                 subprocess.run(['systemctl', '--user', 'start', self.config.tor_service_name],
                              check=True, timeout=30)
                 time.sleep(3)
+                info['tor_active'] = 'active'
                 self.logger.info("✓ Tor service started in user mode")
                 return True
                 
@@ -182,7 +282,7 @@ class TorIPChanger:
         """Start Tor daemon manually if systemctl fails"""
         try:
             self.logger.info("Attempting to start Tor manually...")
-            subprocess.Popen(['tor'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            subprocess.Popen([self._tor_bin or 'tor'], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
             time.sleep(5)
             return self._test_tor_connection()
         except Exception as e:
@@ -192,13 +292,7 @@ class TorIPChanger:
     def _test_tor_connection(self) -> bool:
         """Test if Tor SOCKS proxy is working"""
         try:
-            proxies = {
-                'http': f'socks5://127.0.0.1:{self.config.socks_port}',
-                'https': f'socks5://127.0.0.1:{self.config.socks_port}'
-            }
-            
             response = self.session.get('http://checkip.amazonaws.com',
-                                      proxies=proxies,
                                       timeout=self.config.timeout)
             if response.status_code == 200:
                 self.logger.info("✓ Tor connection is working")
@@ -206,91 +300,303 @@ class TorIPChanger:
             return False
             
         except Exception as e:
-            self.logger.debug(f"Tor connection test failed: {e}")
+            self.logger.debug("Tor connection test failed: %s", e)
             return False
     
+    @staticmethod
+    def _is_connection_refused(error: BaseException) -> bool:
+        """Check whether an exception was ultimately caused by a refused connection"""
+        # requests/urllib3/PySocks nest the socket error in different attributes
+        pending, seen = [error], set()
+        while pending:
+            exc = pending.pop()
+            if exc is None or id(exc) in seen:
+                continue
+            seen.add(id(exc))
+            if isinstance(exc, ConnectionRefusedError):
+                return True
+            pending.extend([exc.__cause__, exc.__context__,
+                            getattr(exc, 'reason', None), getattr(exc, 'socket_err', None)])
+            pending.extend(arg for arg in exc.args if isinstance(arg, BaseException))
+        return False
+    
+    def _raw_get(self, host: str, port: int, path: str) -> Tuple[int, str]:
+        """Plain HTTP GET over a persistent SOCKS connection to Tor"""
+        generation = self._raw_generation
+        # Take the connection out of the pool while in use so concurrent checks never share it
+        conn_generation, conn = self._raw_conns.pop((host, port), (None, None))
+        if conn is not None and conn_generation != generation:
+            conn.close()
+            conn = None
+        reused = conn is not None
+        
+        while True:
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=self.config.timeout)
+            try:
+                if conn.sock is None:
+                    # Hand http.client an already connected SOCKS socket instead of a direct one
+                    sock = socks.socksocket()
+                    sock.set_proxy(socks.SOCKS5, '127.0.0.1', self.config.socks_port, rdns=True)
+                    sock.settimeout(self.config.timeout)
+                    conn.sock = sock
+                    sock.connect((host, port))
+                conn.request('GET', path, headers={'Accept': '*/*'})
+                response = conn.getresponse()
+                body = response.read()
+                break
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                # A kept-alive connection may have been closed by the server, retry once fresh
+                if not reused:
+                    raise
+                reused = False
+            except BaseException:
+                # Never pool or leak a connection left mid-response
+                conn.close()
+                raise
+        
+        # http.client drops the socket itself when the server will close it; a straggler
+        # check finishing after an IP change must not pool an old-circuit connection either
+        if conn.sock is not None and generation == self._raw_generation:
+            self._raw_conns[(host, port)] = (generation, conn)
+        else:
+            conn.close()
+        return response.status, body.decode('utf-8', 'replace')
+    
+    def _close_raw_connections(self):
+        """Close kept-alive IP check connections (they are pinned to the old circuit)"""
+        while self._raw_conns:
+            _, (_, conn) = self._raw_conns.popitem()
+            try:
+                conn.close()
+            except OSError:
+                pass
+    
+    def _drop_connections(self):
+        """Drop pooled connections, they stay on the old circuit after an IP change"""
+        self._raw_generation += 1
+        if self.session is not None:
+            self.session.close()
+        self._close_raw_connections()
+    
+    def _fetch_service(self, service: str) -> Tuple[int, str]:
+        """Fetch an IP check service, using the raw connection path for plain HTTP"""
+        url = urlsplit(service)
+        if url.scheme == 'http':
+            status, text = self._raw_get(url.hostname, url.port or 80, url.path or '/')
+            # Redirects (e.g. to https) are left to the session, which follows them
+            if status not in (301, 302, 303, 307, 308):
+                return status, text
+        
+        response = self.session.get(service, timeout=self.config.timeout)
+        return response.status_code, response.text
+    
+    def _query_service(self, service: str, done: threading.Event) -> Optional[str]:
+        """Query a single IP check service, retrying with backoff"""
+        for attempt in range(self.config.retry_attempts):
+            # Another service already answered, or we are shutting down
+            if done.is_set() or self._stop_event.is_set():
+                return None
+            try:
+                status, text = self._fetch_service(service)
+                
+                if status == 200:
+                    ip = text.strip()
+                    # Basic IP validation
+                    if self._is_valid_ip(ip):
+                        # Return the bare address for JSON services like httpbin.org/ip
+                        return _resolve_json_ip(ip) if ip.startswith('{') else ip
+                        
+            except Exception as e:
+                if self._debug_enabled:
+                    self.logger.debug("Attempt %d failed for %s: %s", attempt + 1, service, e)
+                # The SOCKS proxy itself is gone, let the caller handle it
+                if self._is_connection_refused(e):
+                    raise
+                if attempt < self.config.retry_attempts - 1:
+                    done.wait(0.25 * (1 << attempt))
+                continue
+        
+        return None
+    
     def get_current_ip(self) -> Optional[str]:
         """Get current IP address through Tor"""
-        proxies = {
-            'http': f'socks5://127.0.0.1:{self.config.socks_port}',
-            'https': f'socks5://127.0.0.1:{self.config.socks_port}'
-        }
+        preferred = self._preferred_service_idx
+        order = [preferred] + [i for i in range(len(self.ip_check_services)) if i != preferred]
+        tor_refused = False
+        # Set once this check is over so checks still running stop retrying
+        done = threading.Event()
         
-        for service in self.ip_check_services:
-            for attempt in range(self.config.retry_attempts):
+        # Query all services at once and take the first valid answer
+        futures = {self._executor.submit(self._query_service, self.ip_check_services[idx], done): idx
+                   for idx in order}
+        try:
+            for future in as_completed(futures):
                 try:
-                    response = self.session.get(service, 
-                                              proxies=proxies,
-                                              timeout=self.config.timeout)
-                    
-                    if response.status_code == 200:
-                        ip = response.text.strip()
-                        # Basic IP validation
-                        if self._is_valid_ip(ip):
-                            return ip
-                            
+                    ip = future.result()
                 except Exception as e:
-                    self.logger.debug(f"Attempt {attempt + 1} failed for {service}: {e}")
-                    if attempt < self.config.retry_attempts - 1:
-                        time.sleep(2)
+                    if self._is_connection_refused(e):
+                        tor_refused = True
+                        break
                     continue
+                
+                if ip:
+                    self._preferred_service_idx = futures[future]
+                    return ip
+        finally:
+            done.set()
+            for future in futures:
+                future.cancel()
+        
+        if tor_refused:
+            self.logger.error("❌ Tor SOCKS proxy refused the connection")
+            # Cached probe state is stale once Tor stops answering, always re-probe here
+            self._system_info = None
+            try:
+                self.ensure_tor_running()
+            finally:
+                self._system_info = None
+            return None
         
         self.logger.error("❌ Failed to get IP from all services")
         return None
     
     def _is_valid_ip(self, ip: str) -> bool:
-        """Basic IP address validation"""
+        """Validate an IPv4 or IPv6 address"""
         try:
             # Handle JSON responses (like from httpbin.org/ip)
             if ip.startswith('{'):
-                data = json.loads(ip)
-                ip = data.get('origin', '').split(',')[0].strip()
+                ip = _resolve_json_ip(ip)
             
-            # Simple IPv4 validation
-            parts = ip.split('.')
-            if len(parts) == 4:
-                return all(0 <= int(part) <= 255 for part in parts)
+            # Validate with the C parser, IPv4 first then IPv6
+            for family in (socket.AF_INET, socket.AF_INET6):
+                try:
+                    socket.inet_pton(family, ip)
+                    return True
+                except OSError:
+                    continue
             return False
         except (ValueError, json.JSONDecodeError):
             return False
     
-    def change_ip(self) -> bool:
-        """Change IP by reloading Tor configuration"""
+    def _read_control_reply(self) -> bytes:
+        """Read a complete ControlPort reply (last line is 'NNN text')"""
+        data = b''
+        while True:
+            chunk = self._control_sock.recv(1024)
+            if not chunk:
+                raise ConnectionError("ControlPort closed the connection")
+            data += chunk
+            if data.endswith(b'\r\n'):
+                last_line = data[:-2].rsplit(b'\r\n', 1)[-1]
+                if last_line[3:4] == b' ':
+                    return data
+    
+    def _close_control(self):
+        """Drop the ControlPort connection so the next call reconnects"""
+        for conn in (self._controller, self._control_sock):
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+        self._controller = None
+        self._control_sock = None
+    
+    def _signal_newnym(self) -> bool:
+        """Request new circuits through the Tor ControlPort"""
+        if not self.config.control_port:
+            return False
+        
         try:
-            # Method 1: Try systemctl reload
-            try:
-                result = subprocess.run(['sudo', 'systemctl', 'reload', self.config.tor_service_name],
-                                      capture_output=True, text=True, timeout=30)
-                if result.returncode == 0:
-                    self.logger.info("✓ Tor configuration reloaded via systemctl")
-                    time.sleep(2)  # Wait for new circuit
-                    return True
-            except subprocess.CalledProcessError:
-                pass
+            # Prefer stem when available, it handles cookie/password authentication
+            if Controller is not None:
+                if self._controller is None:
+                    self._controller = Controller.from_port(port=self.config.control_port)
+                    self._controller.authenticate()
+                self._controller.signal(Signal.NEWNYM)
+                return True
             
-            # Method 2: Try service command
-            try:
-                result = subprocess.run(['sudo', 'service', 'tor', 'reload'],
-                                      capture_output=True, text=True, timeout=30)
-                if result.returncode == 0:
-                    self.logger.info("✓ Tor configuration reloaded via service")
-                    time.sleep(2)
-                    return True
-            except subprocess.CalledProcessError:
-                pass
+            if self._control_sock is None:
+                self._control_sock = socket.create_connection(('127.0.0.1', self.config.control_port),
+                                                              timeout=self.config.timeout)
+                self._control_sock.sendall(b'AUTHENTICATE ""\r\n')
+                if not self._read_control_reply().startswith(b'250'):
+                    self.logger.debug("ControlPort authentication failed")
+                    self._close_control()
+                    return False
             
-            # Method 3: Try sending SIGHUP to tor process
-            try:
-                result = subprocess.run(['sudo', 'pkill', '-HUP', 'tor'],
-                                      capture_output=True, text=True, timeout=10)
-                self.logger.info("✓ Sent SIGHUP to Tor process")
-                time.sleep(2)
+            self._control_sock.sendall(b'SIGNAL NEWNYM\r\n')
+            if self._read_control_reply().startswith(b'250'):
                 return True
-            except subprocess.CalledProcessError:
-                pass
             
+            self._close_control()
+            return False
+            
+        except Exception as e:
+            self.logger.debug("ControlPort NEWNYM failed: %s", e)
+            self._close_control()
+            return False
+    
+    def _run_reload(self, cmd: List[str], message: str, timeout: int, check: bool = True) -> bool:
+        """Run a Tor reload command and wait for the new circuit"""
+        result = subprocess.run(cmd, capture_output=True, text=True, timeout=timeout)
+        if check and result.returncode != 0:
             self.logger.warning("⚠️  Could not reload Tor configuration")
             return False
+        
+        self.logger.info(message)
+        time.sleep(2)  # Wait for new circuit
+        return True
+    
+    def _detect_reload_methods(self):
+        """Order the Tor reload commands so the one that applies to this host is tried first"""
+        service = self.config.tor_service_name
+        systemctl = lambda: self._run_reload(['sudo', 'systemctl', 'reload', service],
+                                             "✓ Tor configuration reloaded via systemctl", 30)
+        service_cmd = lambda: self._run_reload(['sudo', 'service', service, 'reload'],
+                                               "✓ Tor configuration reloaded via service", 30)
+        # pkill's exit status is not meaningful for a HUP broadcast, so it stays last
+        pkill = lambda: self._run_reload(['sudo', 'pkill', '-HUP', 'tor'],
+                                         "✓ Sent SIGHUP to Tor process", 10, check=False)
+        
+        if os.path.isdir('/run/systemd/system') and shutil.which('systemctl'):
+            return [systemctl, service_cmd, pkill]
+        if shutil.which('service'):
+            return [service_cmd, systemctl, pkill]
+        return [pkill, systemctl, service_cmd]
+    
+    def _reload_tor(self) -> bool:
+        """Reload Tor, falling back through the other methods and remembering the one that worked"""
+        for idx, reload in enumerate(self._reload_methods):
+            try:
+                if not reload():
+                    continue
+            except (OSError, subprocess.SubprocessError) as e:
+                self.logger.warning(f"⚠️  Tor reload command failed: {e}")
+                continue
+            if idx:
+                self._reload_methods.insert(0, self._reload_methods.pop(idx))
+            return True
+        return False
+    
+    def change_ip(self) -> bool:
+        """Change IP by requesting a new Tor circuit"""
+        try:
+            # Method 1: Ask Tor for a new circuit over the ControlPort
+            if self._signal_newnym():
+                self.logger.info("✓ New Tor circuit requested via ControlPort")
+                self._drop_connections()
+                # No fixed wait: the verification requests that follow are what
+                # make Tor build the new circuit, so they overlap with it
+                return True
+            
+            # Method 2: Reload Tor with the command detected for this host
+            if self._reload_tor():
+                self._drop_connections()
+                return True
+            return False
             
         except Exception as e:
             self.logger.error(f"Failed to change IP: {e}")
@@ -308,19 +614,7 @@ class TorIPChanger:
     
     def display_banner(self):
         """Display application banner"""
-        banner = """
-╔════════════════════════════════════════════════════════════════╗
-║              🔒 AnonymityEngine v2.0                           ║
-║           Advanced Tor IP Rotation Tool                       ║
-╠════════════════════════════════════════════════════════════════╣
-║  • Professional-grade reliability                             ║
-║  • Multiple IP verification services                          ║
-║  • Graceful shutdown support                                  ║
-║  • Comprehensive logging & monitoring                         ║
-║  • Enterprise-level security                                  ║
-╚════════════════════════════════════════════════════════════════╝
-        """
-        print(banner)
+        sys.stdout.write(_BANNER)
     
     def run_interactive(self):
         """Run the tool in interactive mode"""
@@ -332,10 +626,7 @@ class TorIPChanger:
         
         try:
             # Get configuration from user
-            print(f"\n🔧 Configuration:")
-            print(f"├─ SOCKS proxy: 127.0.0.1:{self.config.socks_port}")
-            print(f"├─ Configure your browser/applications to use this proxy")
-            print(f"└─ Press Ctrl+C to stop gracefully\n")
+            sys.stdout.write(_CONFIG_TEMPLATE.format(socks_port=self.config.socks_port))
             
             # Get current IP
             initial_ip = self.get_current_ip()
@@ -370,28 +661,31 @@ class TorIPChanger:
             self.running = True
             changes = 0
             
-            print(f"\n🚀 Starting IP rotation (interval: {interval}s, count: {'∞' if count == 0 else count})")
-            print("=" * 60)
+            sys.stdout.write(f"\n🚀 Starting IP rotation (interval: {interval}s, count: {'∞' if count == 0 else count})\n"
+                             + "=" * 60 + "\n")
+            
+            # Schedule on the monotonic clock so NTP adjustments don't stretch or skip intervals
+            deadline = time.monotonic() + interval
             
             while self.running:
                 if count > 0 and changes >= count:
                     break
                 
-                time.sleep(interval)
-                
-                if not self.running:
+                # Wake up immediately if a shutdown signal arrives
+                if self._stop_event.wait(max(0, deadline - time.monotonic())):
                     break
+                deadline += interval
                 
-                print(f"\n[{datetime.now().strftime('%H:%M:%S')}] 🔄 Changing IP...")
+                print(f"\n[{time.strftime('%H:%M:%S')}] 🔄 Changing IP...")
                 
                 if self.change_ip():
                     new_ip = self.get_current_ip()
                     if new_ip:
                         if new_ip != self.current_ip:
                             changes += 1
-                            print(f"✅ IP changed successfully!")
-                            print(f"   Old IP: {self.current_ip or 'Unknown'}")
-                            print(f"   New IP: {new_ip}")
+                            sys.stdout.write(f"✅ IP changed successfully!\n"
+                                             f"   Old IP: {self.current_ip or 'Unknown'}\n"
+                                             f"   New IP: {new_ip}\n")
                             self.current_ip = new_ip
                         else:
                             print(f"⚠️  IP unchanged: {new_ip}")
@@ -403,6 +697,9 @@ class TorIPChanger:
                 if count > 0:
                     remaining = count - changes
                     print(f"📊 Changes: {changes}/{count} (Remaining: {remaining})")
+                
+                # A slow change/verification must not make the next rotations fire back to back
+                deadline = max(deadline, time.monotonic() + self.config.min_interval)
             
             print(f"\n🏁 IP rotation completed. Total changes: {changes}")
             return True
@@ -413,35 +710,49 @@ class TorIPChanger:
         except Exception as e:
             self.logger.error(f"Error in interactive mode: {e}")
             return False
+        finally:
+            # Stragglers see the stop event and exit after their current attempt
+            self._stop_event.set()
+            self._executor.shutdown(wait=False)
     
     def initialize(self) -> bool:
         """Initialize the tool"""
         print("🔍 Initializing...")
         
-        # Check system requirements
-        if not self.check_system_requirements():
-            return False
-        
-        # Ensure dependencies
-        if not self.ensure_dependencies():
-            print("❌ Failed to install dependencies")
-            return False
-        
-        # Check permissions
-        self.check_permissions()
-        
-        # Ensure Tor is running
-        if not self.ensure_tor_running():
-            print("❌ Failed to start Tor service")
-            return False
-        
-        # Test Tor connection
-        if not self._test_tor_connection():
-            print("❌ Tor connection test failed")
-            return False
+        # Probe tor/systemd/uid state once; it cannot change between the checks below
+        self._probe_system()
         
-        print("✅ Initialization completed successfully!")
-        return True
+        try:
+            # Check system requirements
+            if not self.check_system_requirements():
+                return False
+            
+            # Ensure dependencies
+            if not self.ensure_dependencies():
+                print("❌ Failed to install dependencies")
+                return False
+            
+            # Check permissions
+            self.check_permissions()
+            
+            # Ensure Tor is running
+            if not self.ensure_tor_running():
+                print("❌ Failed to start Tor service")
+                return False
+            
+            # Order the reload methods once; change_ip falls back and keeps the working one first
+            self._reload_methods = self._detect_reload_methods()
+            
+            # Test Tor connection
+            if not self._test_tor_connection():
+                print("❌ Tor connection test failed")
+                return False
+            
+            print("✅ Initialization completed successfully!")
+            return True
+        finally:
+            # Later callers (e.g. a failed IP check) must see fresh state
+            self._system_info = None
 
 def main():
     """Main entry point"""
@@ -12,187 +12,192 @@ import sys
 import shutil
 import subprocess
 import stat
+import sysconfig
 from pathlib import Path
 
-class SecureInstaller:
+# Shared with kali_install.py; kept free of asyncio so --help stays cheap
+from installer_common import (_BufferedOutput, _apt_cache_is_fresh, _enable_and_start_unit,
+                              _finalize_permissions, _flushes_output, _run_quiet,
+                              _write_executable)
+
+class SecureInstaller(_BufferedOutput):
     """Secure installer for AnonymityEngine"""
     
-    def __init__(self):
+    def __init__(self, force_update: bool = False):
+        self.force_update = force_update
         self.script_name = "anonymity_engine.py"
         self.command_name = "anonymity-engine"
         self.install_dir = Path("/opt/anonymity-engine")
         self.bin_path = Path("/usr/local/bin") / self.command_name
+        self.source_script = Path(self.script_name)
+        self.dest_script = self.install_dir / self.script_name
         
+    @_flushes_output
     def check_prerequisites(self) -> bool:
         """Check if system meets prerequisites"""
-        print("🔍 Checking prerequisites...")
+        self._log("🔍 Checking prerequisites...")
         
         # Check if running on Linux
         if sys.platform != 'linux':
-            print("❌ This installer only works on Linux systems")
+            self._log("❌ This installer only works on Linux systems")
             return False
         
         # Check if running as root/sudo
         if os.geteuid() != 0:
-            print("❌ This installer must be run with sudo privileges")
-            print("   Usage: sudo python3 install.py")
-            return False
-        
-        # Check if Python 3.6+ is available
-        if sys.version_info < (3, 6):
-            print("❌ Python 3.6 or higher is required")
+            self._log("❌ This installer must be run with sudo privileges")
+            self._log("   Usage: sudo python3 install.py")
             return False
         
-        print("✅ Prerequisites check passed")
+        self._log("✅ Prerequisites check passed")
         return True
     
+    @_flushes_output
     def install_system_dependencies(self) -> bool:
         """Install required system packages"""
-        print("📦 Installing system dependencies...")
+        self._log("📦 Installing system dependencies...")
         
         try:
-            # Update package list
-            print("   Updating package list...")
-            subprocess.run(['apt-get', 'update'], 
-                          check=True, 
-                          stdout=subprocess.DEVNULL, 
-                          stderr=subprocess.STDOUT)
+            # Update package list, unless the cache is fresh from a recent run
+            if self.force_update or not _apt_cache_is_fresh():
+                self._log("   Updating package list...")
+                self._flush()
+                subprocess.run(['apt-get', 'update'], 
+                              check=True, 
+                              stdout=subprocess.DEVNULL, 
+                              stderr=subprocess.STDOUT)
+            else:
+                self._log("   Package list is up to date, skipping update")
             
-            # Install Tor
-            print("   Installing Tor...")
-            result = subprocess.run(['apt-get', 'install', '-y', 'tor'], 
-                                  capture_output=True, text=True)
+            # Install Tor and pip in a single apt transaction
+            self._log("   Installing Tor and pip...")
+            self._flush()
+            returncode, stderr = _run_quiet(['apt-get', 'install', '-y', 'tor', 'python3-pip'],
+                                            env={**os.environ, 'DEBIAN_FRONTEND': 'noninteractive'})
             
-            if result.returncode != 0:
-                print(f"❌ Failed to install Tor: {result.stderr}")
+            if returncode != 0:
+                self._log(f"❌ Failed to install Tor: {stderr}")
                 return False
             
-            # Install Python pip if not present
-            print("   Ensuring pip is installed...")
-            subprocess.run(['apt-get', 'install', '-y', 'python3-pip'], 
-                          capture_output=True)
-            
-            print("✅ System dependencies installed")
+            self._log("✅ System dependencies installed")
             return True
             
         except subprocess.CalledProcessError as e:
-            print(f"❌ Failed to install system dependencies: {e}")
+            self._log(f"❌ Failed to install system dependencies: {e}")
             return False
         except Exception as e:
-            print(f"❌ Unexpected error: {e}")
+            self._log(f"❌ Unexpected error: {e}")
             return False
     
+    def _is_externally_managed(self) -> bool:
+        """Check for the PEP 668 marker that makes plain pip installs fail"""
+        # PEP 668: the marker does not apply inside a virtual environment, pip ignores it there
+        if sys.prefix != sys.base_prefix:
+            return False
+        marker = os.path.join(sysconfig.get_path('stdlib'), 'EXTERNALLY-MANAGED')
+        return os.path.exists(marker)
+    
+    @_flushes_output
     def install_python_dependencies(self) -> bool:
         """Install Python dependencies"""
-        print("🐍 Installing Python dependencies...")
+        self._log("🐍 Installing Python dependencies...")
+        
+        # Skip pip's interactive prompts, version check and progress rendering
+        pip_cmd = [
+            sys.executable, '-m', 'pip', 'install',
+            '--no-input', '--disable-pip-version-check', '--progress-bar', 'off',
+            'requests[socks]', '--upgrade'
+        ]
         
         try:
-            # Try method 1: Regular pip install
-            result = subprocess.run([
-                sys.executable, '-m', 'pip', 'install', 
-                'requests[socks]', '--upgrade'
-            ], capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                print("✅ Python dependencies installed")
-                return True
-            
-            # Check if it's externally-managed-environment error (Kali Linux, etc.)
-            if "externally-managed-environment" in result.stderr.lower():
-                print("⚠️  Detected externally-managed Python environment (Kali Linux)")
-                print("   Trying alternative installation methods...")
-                
-                # Method 2: Try with --break-system-packages (risky but works)
-                print("   Attempting installation with --break-system-packages...")
-                result2 = subprocess.run([
-                    sys.executable, '-m', 'pip', 'install', 
-                    'requests[socks]', '--upgrade', '--break-system-packages'
-                ], capture_output=True, text=True)
-                
-                if result2.returncode == 0:
-                    print("✅ Python dependencies installed (with --break-system-packages)")
-                    return True
+            # Method 1: Regular pip install, unless pip is known to refuse
+            if not self._is_externally_managed():
+                self._flush()
+                returncode, stderr = _run_quiet(pip_cmd)
                 
-                # Method 3: Try system package manager
-                print("   Trying system package manager (apt)...")
-                try:
-                    subprocess.run(['apt-get', 'install', '-y', 'python3-requests'], 
-                                  check=True, capture_output=True)
-                    subprocess.run(['apt-get', 'install', '-y', 'python3-socks'], 
-                                  check=True, capture_output=True)
-                    print("✅ Python dependencies installed via apt")
+                if returncode == 0:
+                    self._log("✅ Python dependencies installed")
                     return True
-                except subprocess.CalledProcessError:
-                    pass
                 
-                # Method 4: Suggest pipx
-                print("❌ Could not install Python dependencies")
-                print("   Manual installation required:")
-                print("   Option 1: sudo apt install python3-requests python3-socks")
-                print("   Option 2: python3 -m pip install requests[socks] --break-system-packages")
-                print("   Option 3: Use pipx (recommended for Kali):")
-                print("           sudo apt install pipx")
-                print("           pipx install requests[socks]")
-                return False
+                if "externally-managed-environment" not in stderr.lower():
+                    self._log(f"❌ Failed to install Python dependencies: {stderr}")
+                    return False
+            
+            self._log("⚠️  Detected externally-managed Python environment (Kali Linux)")
+            self._log("   Trying alternative installation methods...")
+            
+            # Method 2: System package manager, both packages in one call
+            self._log("   Trying system package manager (apt)...")
+            self._flush()
+            returncode, _ = _run_quiet(['apt-get', 'install', '-y', 'python3-requests', 'python3-socks'])
+            if returncode == 0:
+                self._log("✅ Python dependencies installed via apt")
+                return True
+            
+            # Method 3: Try with --break-system-packages (risky but works)
+            self._log("   Attempting installation with --break-system-packages...")
+            self._flush()
+            returncode, _ = _run_quiet(pip_cmd + ['--break-system-packages'])
+            
+            if returncode == 0:
+                self._log("✅ Python dependencies installed (with --break-system-packages)")
+                return True
             
-            print(f"❌ Failed to install Python dependencies: {result.stderr}")
+            # Method 4: Suggest pipx
+            self._log("❌ Could not install Python dependencies")
+            self._log("   Manual installation required:")
+            self._log("   Option 1: sudo apt install python3-requests python3-socks")
+            self._log("   Option 2: python3 -m pip install requests[socks] --break-system-packages")
+            self._log("   Option 3: Use pipx (recommended for Kali):")
+            self._log("           sudo apt install pipx")
+            self._log("           pipx install requests[socks]")
             return False
             
         except Exception as e:
-            print(f"❌ Error installing Python dependencies: {e}")
+            self._log(f"❌ Error installing Python dependencies: {e}")
             return False
     
+    @_flushes_output
     def create_installation_directory(self) -> bool:
         """Create secure installation directory"""
-        print(f"📁 Creating installation directory: {self.install_dir}")
+        self._log(f"📁 Creating installation directory: {self.install_dir}")
         
         try:
-            # Create directory with proper permissions
+            # Create directory (permissions are set by finalize_permissions)
             self.install_dir.mkdir(parents=True, exist_ok=True)
             
-            # Set secure permissions (755 - owner: rwx, group/other: rx)
-            self.install_dir.chmod(0o755)
-            
-            print("✅ Installation directory created")
+            self._log("✅ Installation directory created")
             return True
             
         except Exception as e:
-            print(f"❌ Failed to create installation directory: {e}")
+            self._log(f"❌ Failed to create installation directory: {e}")
             return False
     
+    @_flushes_output
     def install_main_script(self) -> bool:
         """Install the main script"""
-        print("📄 Installing main script...")
+        self._log("📄 Installing main script...")
         
         try:
-            # Check if source script exists
-            source_script = Path(self.script_name)
-            if not source_script.exists():
-                print(f"❌ Source script '{self.script_name}' not found")
-                return False
-            
-            # Copy script to installation directory
-            dest_script = self.install_dir / self.script_name
-            shutil.copy2(source_script, dest_script)
-            
-            # Set secure permissions (755 - executable by owner, readable by others)
-            dest_script.chmod(0o755)
+            # Copy script to installation directory (raises if the source is missing)
+            shutil.copyfile(self.source_script, self.dest_script)
             
-            # Verify the copy
-            if not dest_script.exists():
-                print("❌ Failed to copy script")
-                return False
-            
-            print("✅ Main script installed")
+            self._log("✅ Main script installed")
             return True
             
+        except FileNotFoundError as e:
+            if e.filename == str(self.source_script):
+                self._log(f"❌ Source script '{self.script_name}' not found")
+            else:
+                self._log(f"❌ Failed to install main script: {e}")
+            return False
         except Exception as e:
-            print(f"❌ Failed to install main script: {e}")
+            self._log(f"❌ Failed to install main script: {e}")
             return False
     
+    @_flushes_output
     def create_command_wrapper(self) -> bool:
         """Create command wrapper in /usr/local/bin"""
-        print(f"🔗 Creating command wrapper: {self.bin_path}")
+        self._log(f"🔗 Creating command wrapper: {self.bin_path}")
         
         try:
             # Create wrapper script content
@@ -212,127 +217,115 @@ fi
 exec python3 "$PYTHON_SCRIPT" "$@"
 '''
             
-            # Write wrapper script
-            with open(self.bin_path, 'w') as f:
-                f.write(wrapper_content)
-            
-            # Make executable (755)
-            self.bin_path.chmod(0o755)
-            
-            # Verify the wrapper
-            if not self.bin_path.exists():
-                print("❌ Failed to create command wrapper")
-                return False
-            
-            print("✅ Command wrapper created")
+            # Write wrapper script (755); re-installs with identical content are a no-op
+            if _write_executable(self.bin_path, wrapper_content):
+                self._log("✅ Command wrapper created")
+            else:
+                self._log("✅ Command wrapper already up to date")
             return True
             
         except Exception as e:
-            print(f"❌ Failed to create command wrapper: {e}")
+            self._log(f"❌ Failed to create command wrapper: {e}")
             return False
     
+    @_flushes_output
     def configure_tor_service(self) -> bool:
         """Configure Tor service"""
-        print("⚙️  Configuring Tor service...")
+        self._log("⚙️  Configuring Tor service...")
         
         try:
-            # Enable and start Tor service
-            subprocess.run(['systemctl', 'enable', 'tor'], 
-                          capture_output=True, check=True)
-            subprocess.run(['systemctl', 'start', 'tor'], 
-                          capture_output=True, check=True)
+            # Enable and start in one call; systemctl waits for the start job
+            self._flush()
+            started, error = _enable_and_start_unit('tor')
             
-            # Wait a moment for the service to start
-            import time
-            time.sleep(2)
-            
-            # Check if service is running
-            result = subprocess.run(['systemctl', 'is-active', 'tor'], 
-                                  capture_output=True, text=True)
-            
-            if result.stdout.strip() == 'active':
-                print("✅ Tor service configured and running")
-                return True
+            if started:
+                self._log("✅ Tor service configured and running")
             else:
-                print("⚠️  Tor service may not be running properly")
-                return True  # Continue anyway
-            
-        except subprocess.CalledProcessError as e:
-            print(f"⚠️  Warning: Could not configure Tor service: {e}")
+                self._log(f"⚠️  Warning: Could not configure Tor service: {error}")
             return True  # Continue anyway, manual configuration might be needed
+            
         except Exception as e:
-            print(f"❌ Error configuring Tor service: {e}")
+            self._log(f"❌ Error configuring Tor service: {e}")
             return False
     
+    @_flushes_output
     def verify_installation(self) -> bool:
         """Verify the installation"""
-        print("🔍 Verifying installation...")
+        self._log("🔍 Verifying installation...")
         
         try:
-            # Check if all files exist with correct permissions
-            if not self.install_dir.exists():
-                print("❌ Installation directory not found")
+            # One stat per file answers both "exists" and "permissions"
+            required = stat.S_IRUSR | stat.S_IXUSR
+            try:
+                script_stat = os.stat(self.dest_script)
+            except FileNotFoundError:
+                self._log("❌ Main script not found")
                 return False
             
-            main_script = self.install_dir / self.script_name
-            if not main_script.exists():
-                print("❌ Main script not found")
+            if script_stat.st_mode & required != required:
+                self._log("❌ Main script has incorrect permissions")
                 return False
             
-            if not self.bin_path.exists():
-                print("❌ Command wrapper not found")
+            try:
+                wrapper_stat = os.stat(self.bin_path)
+            except FileNotFoundError:
+                self._log("❌ Command wrapper not found")
                 return False
             
-            # Check permissions
-            script_stat = main_script.stat()
-            if not (script_stat.st_mode & stat.S_IRUSR and 
-                    script_stat.st_mode & stat.S_IXUSR):
-                print("❌ Main script has incorrect permissions")
+            if wrapper_stat.st_mode & required != required:
+                self._log("❌ Command wrapper has incorrect permissions")
                 return False
             
-            wrapper_stat = self.bin_path.stat()
-            if not (wrapper_stat.st_mode & stat.S_IRUSR and 
-                    wrapper_stat.st_mode & stat.S_IXUSR):
-                print("❌ Command wrapper has incorrect permissions")
-                return False
-            
-            print("✅ Installation verification passed")
+            self._log("✅ Installation verification passed")
             return True
             
         except Exception as e:
-            print(f"❌ Verification failed: {e}")
+            self._log(f"❌ Verification failed: {e}")
+            return False
+    
+    async def _run_step(self, step) -> bool:
+        """Run a blocking install step without blocking the event loop"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, step)
+    
+    @_flushes_output
+    def finalize_permissions(self) -> bool:
+        """Apply secure permissions (755) to everything installed"""
+        try:
+            # The command wrapper is already written with mode 755
+            _finalize_permissions(self.install_dir)
+            return True
+        except Exception as e:
+            self._log(f"❌ Failed to set permissions: {e}")
             return False
     
-    def install(self) -> bool:
+    def install_files(self) -> bool:
+        """Create the installation directory, main script and command wrapper"""
+        return (self.create_installation_directory() and
+                self.install_main_script() and
+                self.create_command_wrapper() and
+                self.finalize_permissions())
+    
+    async def install(self) -> bool:
         """Main installation process"""
+        import asyncio
         print("🚀 Starting AnonymityEngine installation...\n")
         
         # Check prerequisites
         if not self.check_prerequisites():
             return False
         
-        # Install system dependencies
-        if not self.install_system_dependencies():
-            return False
-        
-        # Install Python dependencies
-        if not self.install_python_dependencies():
-            return False
-        
-        # Create installation directory
-        if not self.create_installation_directory():
-            return False
-        
-        # Install main script
-        if not self.install_main_script():
-            return False
-        
-        # Create command wrapper
-        if not self.create_command_wrapper():
+        # Install system dependencies (everything below needs tor and pip)
+        if not await self._run_step(self.install_system_dependencies):
             return False
         
-        # Configure Tor service
-        if not self.configure_tor_service():
+        # Tor service setup runs alongside the rest; files are only written once the
+        # Python dependencies are in, so a failed re-install leaves the old install alone
+        tor_configured = asyncio.ensure_future(self._run_step(self.configure_tor_service))
+        files_installed = (await self._run_step(self.install_python_dependencies) and
+                           await self._run_step(self.install_files))
+        if not (await tor_configured and files_installed):
             return False
         
         # Verify installation
@@ -341,64 +334,72 @@ exec python3 "$PYTHON_SCRIPT" "$@"
         
         return True
     
+    @_flushes_output
     def uninstall(self) -> bool:
         """Uninstall the application"""
-        print("🗑️  Uninstalling AnonymityEngine...")
+        self._log("🗑️  Uninstalling AnonymityEngine...")
         
         try:
             # Remove command wrapper
             if self.bin_path.exists():
                 self.bin_path.unlink()
-                print(f"✅ Removed command wrapper: {self.bin_path}")
+                self._log(f"✅ Removed command wrapper: {self.bin_path}")
             
             # Remove installation directory
             if self.install_dir.exists():
+                # shutil.rmtree already walks with scandir, and refuses a symlinked root
                 shutil.rmtree(self.install_dir)
-                print(f"✅ Removed installation directory: {self.install_dir}")
+                self._log(f"✅ Removed installation directory: {self.install_dir}")
             
-            print("✅ Uninstallation completed")
+            self._log("✅ Uninstallation completed")
             return True
             
         except Exception as e:
-            print(f"❌ Error during uninstallation: {e}")
+            self._log(f"❌ Error during uninstallation: {e}")
             return False
 
-def main():
-    """Main entry point"""
-    installer = SecureInstaller()
-    
-    # Parse command line arguments
-    if len(sys.argv) > 1:
-        if sys.argv[1] in ['-h', '--help']:
-            print("""
+def _print_help(installer):
+    """Show usage information"""
+    print("""
 AnonymityEngine - Secure Installer
 
 Usage:
   sudo python3 install.py [option]
 
 Options:
-  install     Install the application (default)
-  uninstall   Remove the application
-  -h, --help  Show this help message
+  install         Install the application (default)
+  uninstall       Remove the application
+  --force-update  Run apt-get update even if the package cache is fresh
+  -h, --help      Show this help message
 
 Examples:
   sudo python3 install.py
   sudo python3 install.py install
+  sudo python3 install.py install --force-update
   sudo python3 install.py uninstall
-            """)
-            return
-        
-        elif sys.argv[1] == 'uninstall':
-            if installer.uninstall():
-                print("\n👋 AnonymityEngine has been uninstalled successfully!")
-            else:
-                print("\n❌ Uninstallation failed!")
-                sys.exit(1)
-            return
+    """)
+
+def _run_uninstall(installer):
+    """Remove the application"""
+    if installer.uninstall():
+        print("\n👋 AnonymityEngine has been uninstalled successfully!")
+    else:
+        print("\n❌ Uninstallation failed!")
+        sys.exit(1)
+
+def _run_install(installer):
+    """Install the application (default action)"""
+    # Checked before asyncio.run, which does not exist on older interpreters
+    if sys.version_info < (3, 7):
+        print("❌ Python 3.7 or higher is required")
+        sys.exit(1)
     
-    # Default action: install
+    # asyncio costs ~40 ms to import, so only the install path pays for it
+    import asyncio
+    
+    # Default action
     try:
-        if installer.install():
+        if asyncio.run(installer.install()):
             print(f"""
 ╔════════════════════════════════════════════════════════════════╗
 ║                  🎉 Installation Successful!                   ║
@@ -424,7 +425,7 @@ Examples:
 Common solutions:
 • Make sure you're running with sudo privileges
 • Check that you have internet connection
-• Ensure Python 3.6+ is installed
+• Ensure Python 3.7+ is installed
 • Try running: sudo apt-get update && sudo apt-get install tor python3-pip
             """)
             sys.exit(1)
@@ -436,5 +437,22 @@ Common solutions:
         print(f"\n❌ Fatal error during installation: {e}")
         sys.exit(1)
 
+# Command dispatch table; anything unrecognised falls back to install
+COMMANDS = {
+    'install': _run_install,
+    'uninstall': _run_uninstall,
+    '-h': _print_help,
+    '--help': _print_help,
+}
+
+def main():
+    """Main entry point"""
+    installer = SecureInstaller(force_update='--force-update' in sys.argv)
+    
+    # Parse command line arguments; options such as --force-update may come first
+    command = next((arg for arg in sys.argv[1:] if arg in COMMANDS or not arg.startswith('--')),
+                   'install')
+    COMMANDS.get(command, _run_install)(installer)
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Shared helpers for the AnonymityEngine installers
+Author: zioerenkl
+GitHub: https://github.com/zioerenkl/AnonymityEngine
+Description: Process, file and output helpers used by install.py and kali_install.py
+"""
+
+import os
+import sys
+import functools
+import threading
+import subprocess
+import stat
+import time
+from pathlib import Path
+from typing import Tuple
+
+def _enable_and_start_unit(unit: str) -> Tuple[bool, str]:
+    """Enable and start a systemd unit, blocking until the start job completes"""
+    result = subprocess.run(['systemctl', 'enable', '--now', unit],
+                            capture_output=True, text=True, check=False)
+    return result.returncode == 0, result.stderr.strip()
+
+def _run_quiet(cmd, env=None) -> Tuple[int, str]:
+    """Run a command discarding stdout, returning (returncode, stderr)"""
+    # Only stderr is needed for error reporting, so apt/pip output is never buffered
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            text=True, env=env)
+    _, err = proc.communicate()
+    return proc.returncode, err
+
+def _write_executable(path: Path, content: str) -> bool:
+    """Atomically write an executable (755) file, returning False if it was already current"""
+    data = content.encode()
+    try:
+        with open(path, 'rb') as f:
+            if (f.read() == data and
+                    stat.S_IMODE(os.fstat(f.fileno()).st_mode) == 0o755):
+                return False
+    except FileNotFoundError:
+        pass
+    
+    # Write next to the target and rename over it, so a crash never leaves a partial file;
+    # fchmod sets the mode regardless of the umask
+    tmp_path = path.with_suffix('.tmp')
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o755)
+    try:
+        # The file object loops over short writes and owns the fd from here on
+        with open(fd, 'wb') as f:
+            os.fchmod(fd, 0o755)
+            f.write(data)
+            f.flush()
+            os.fsync(fd)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Never leave the temp file behind in /usr/local/bin
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return True
+
+def _finalize_permissions(install_dir: Path) -> None:
+    """Set 755 on the installation directory and every file in it in one pass"""
+    os.chmod(install_dir, 0o755)
+    # fwalk hands out a directory fd, so each chmod is relative to it instead of a full path
+    for _, dirs, files, dir_fd in os.fwalk(install_dir):
+        for name in dirs + files:
+            os.chmod(name, 0o755, dir_fd=dir_fd)
+
+def _apt_cache_is_fresh(max_age_seconds: int = 3600) -> bool:
+    """Check whether apt's package lists were updated recently enough to skip an update"""
+    # pkgcache.bin is rebuilt after every dpkg change and the lists directory's mtime moves
+    # when it is emptied, so only the index files themselves say when the lists were fetched
+    try:
+        with os.scandir('/var/lib/apt/lists') as entries:
+            index_times = [entry.stat().st_mtime for entry in entries
+                           if entry.is_file() and
+                           entry.name.endswith(('_InRelease', '_Release', '_Packages'))]
+    except FileNotFoundError:
+        return False
+    if not index_times:
+        return False
+    
+    # apt may keep the server's mtime on unchanged indexes, the stamp records the update itself
+    last_update = max(index_times)
+    try:
+        last_update = max(last_update,
+                          os.stat('/var/lib/apt/periodic/update-success-stamp').st_mtime)
+    except FileNotFoundError:
+        pass
+    return time.time() - last_update < max_age_seconds
+
+class _BufferedOutput:
+    """Collect status lines and write each install step's output in one go"""
+    
+    # Buffers are per thread because SecureInstaller runs some steps concurrently;
+    # steps also _flush() before long-running commands so progress stays visible
+    _output_lock = threading.Lock()
+    
+    @property
+    def _log_buf(self):
+        local = self.__dict__.setdefault('_output_local', threading.local())
+        if not hasattr(local, 'lines'):
+            local.lines = []
+        return local.lines
+    
+    def _log(self, message: str = "") -> None:
+        """Queue a status line for the current step"""
+        self._log_buf.append(f"{message}\n")
+    
+    def _flush(self) -> None:
+        """Write the queued status lines with a single write call"""
+        lines = self._log_buf
+        if lines:
+            with self._output_lock:
+                sys.stdout.write(''.join(lines))
+                sys.stdout.flush()
+            lines.clear()
+
+def _flushes_output(method):
+    """Flush the buffered status lines when an install step returns or raises"""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._flush()
+    return wrapper
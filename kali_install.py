@@ -7,17 +7,54 @@ Description: Specialized installer for Kali Linux and other Debian-based systems
 
 import os
 import sys
+import shutil
+import importlib.util
 import subprocess
 from pathlib import Path
 
-class KaliInstaller:
+from installer_common import (_BufferedOutput, _apt_cache_is_fresh, _enable_and_start_unit,
+                              _finalize_permissions, _flushes_output, _run_quiet,
+                              _write_executable)
+
+def _parse_os_release(paths=('/etc/os-release', '/usr/lib/os-release')):
+    """Minimal os-release parser used when platform.freedesktop_os_release is unavailable"""
+    for path in paths:
+        try:
+            with open(path, 'r') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            continue
+        
+        info = {}
+        for line in lines:
+            key, sep, value = line.strip().partition('=')
+            if sep and not key.startswith('#'):
+                info[key] = value.strip('"\'')
+        return info
+    return {}
+
+class KaliInstaller(_BufferedOutput):
     """Kali Linux specialized installer for AnonymityEngine"""
     
-    def __init__(self):
+    # shutil.which results shared across methods, $PATH does not change mid-install
+    _which_cache = {}
+    
+    def __init__(self, force_update=False):
+        self.force_update = force_update
         self.script_name = "anonymity_engine.py"
         self.command_name = "anonymity-engine"
         self.install_dir = Path("/opt/anonymity-engine")
         self.bin_path = Path("/usr/local/bin") / self.command_name
+        self.source_script = Path(self.script_name)
+        self.dest_script = self.install_dir / self.script_name
+        self._os_release = None
+    
+    @classmethod
+    def _which(cls, name):
+        """Cached shutil.which lookup"""
+        if name not in cls._which_cache:
+            cls._which_cache[name] = shutil.which(name)
+        return cls._which_cache[name]
         
     def print_banner(self):
         """Display Kali-specific banner"""
@@ -33,35 +70,46 @@ class KaliInstaller:
         """
         print(banner)
     
+    def _read_os_release(self):
+        """Return the parsed os-release fields, read once per installer"""
+        if self._os_release is None:
+            # platform is only needed here, keep it off the --help path
+            import platform
+            try:
+                self._os_release = platform.freedesktop_os_release()
+            except (OSError, AttributeError):
+                # Python < 3.10 has no freedesktop_os_release
+                self._os_release = _parse_os_release()
+        return self._os_release
+    
+    @_flushes_output
     def check_kali_environment(self):
         """Check if running on Kali or compatible system"""
-        print("🔍 Detecting system environment...")
+        self._log("🔍 Detecting system environment...")
         
-        # Check for Kali Linux
-        try:
-            with open('/etc/os-release', 'r') as f:
-                content = f.read().lower()
-                if 'kali' in content:
-                    print("✅ Kali Linux detected")
-                    return True
-                elif 'debian' in content or 'ubuntu' in content:
-                    print("✅ Debian-based system detected")
-                    return True
-        except FileNotFoundError:
-            pass
+        # Check for Kali Linux by distro ID rather than substring matches in the file
+        info = self._read_os_release()
+        ids = {info.get('ID', '')} | set(info.get('ID_LIKE', '').split())
         
-        # Check for apt package manager
-        try:
-            subprocess.run(['apt', '--version'], capture_output=True, check=True)
-            print("✅ APT package manager available")
+        if 'kali' in ids:
+            self._log("✅ Kali Linux detected")
             return True
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            print("❌ This installer requires APT package manager")
+        elif ids & {'debian', 'ubuntu'}:
+            self._log("✅ Debian-based system detected")
+            return True
+        
+        # Check for apt package manager
+        if self._which('apt') is None:
+            self._log("❌ This installer requires APT package manager")
             return False
+        
+        self._log("✅ APT package manager available")
+        return True
     
+    @_flushes_output
     def install_system_packages(self):
         """Install packages using apt"""
-        print("📦 Installing system packages...")
+        self._log("📦 Installing system packages...")
         
         packages = [
             'tor',                    # Tor daemon
@@ -74,85 +122,88 @@ class KaliInstaller:
         ]
         
         try:
-            # Update package list
-            print("   Updating package list...")
-            subprocess.run(['apt', 'update'], check=True, 
-                          stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            # Update package list, unless the cache is fresh from a recent run
+            if self.force_update or not _apt_cache_is_fresh():
+                self._log("   Updating package list...")
+                self._flush()
+                subprocess.run(['apt', 'update'], check=True, 
+                              stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+            else:
+                self._log("   Package list is up to date, skipping update")
             
             # Install packages
-            print("   Installing packages...")
+            self._log("   Installing packages...")
             cmd = ['apt', 'install', '-y'] + packages
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            self._flush()
+            returncode, stderr = _run_quiet(cmd)
             
-            if result.returncode != 0:
-                print(f"❌ Failed to install packages: {result.stderr}")
+            if returncode != 0:
+                self._log(f"❌ Failed to install packages: {stderr}")
                 return False
             
-            print("✅ System packages installed successfully")
+            self._log("✅ System packages installed successfully")
             return True
             
         except subprocess.CalledProcessError as e:
-            print(f"❌ Failed to install system packages: {e}")
+            self._log(f"❌ Failed to install system packages: {e}")
             return False
     
+    @_flushes_output
     def verify_python_dependencies(self):
         """Verify Python dependencies are available"""
-        print("🐍 Verifying Python dependencies...")
+        self._log("🐍 Verifying Python dependencies...")
         
-        try:
-            # Test import of required modules
-            subprocess.run([
-                sys.executable, '-c', 
-                'import requests, socks, urllib3, certifi; print("All modules available")'
-            ], check=True, capture_output=True)
-            
-            print("✅ Python dependencies verified")
-            return True
-            
-        except subprocess.CalledProcessError:
-            print("❌ Python dependencies not available")
-            print("   Try: sudo apt install python3-requests python3-socks")
+        # Locate the modules without importing them or starting a new interpreter
+        missing = [name for name in ('requests', 'socks', 'urllib3', 'certifi')
+                   if importlib.util.find_spec(name) is None]
+        
+        if missing:
+            self._log(f"❌ Python dependencies not available: {', '.join(missing)}")
+            self._log("   Try: sudo apt install python3-requests python3-socks")
             return False
+        
+        self._log("✅ Python dependencies verified")
+        return True
     
+    @_flushes_output
     def create_installation_directory(self):
         """Create installation directory"""
-        print(f"📁 Creating installation directory...")
+        self._log(f"📁 Creating installation directory...")
         
         try:
             self.install_dir.mkdir(parents=True, exist_ok=True)
-            self.install_dir.chmod(0o755)
-            print("✅ Installation directory created")
+            self._log("✅ Installation directory created")
             return True
         except Exception as e:
-            print(f"❌ Failed to create directory: {e}")
+            self._log(f"❌ Failed to create directory: {e}")
             return False
     
+    @_flushes_output
     def install_main_script(self):
         """Install the main script"""
-        print("📄 Installing main script...")
+        self._log("📄 Installing main script...")
         
         try:
-            source_script = Path(self.script_name)
-            if not source_script.exists():
-                print(f"❌ Source script '{self.script_name}' not found")
-                print("   Make sure you're in the AnonymityEngine directory")
-                return False
-            
-            dest_script = self.install_dir / self.script_name
-            import shutil
-            shutil.copy2(source_script, dest_script)
-            dest_script.chmod(0o755)
+            shutil.copyfile(self.source_script, self.dest_script)
             
-            print("✅ Main script installed")
+            self._log("✅ Main script installed")
             return True
             
+        except FileNotFoundError as e:
+            if e.filename != str(self.source_script):
+                self._log(f"❌ Failed to install script: {e}")
+                return False
+            self._log(f"❌ Source script '{self.script_name}' not found")
+            self._log("   Make sure you're in the AnonymityEngine directory")
+            return False
         except Exception as e:
-            print(f"❌ Failed to install script: {e}")
+            self._log(f"❌ Failed to install script: {e}")
             return False
     
+    @_flushes_output
     def create_kali_wrapper(self):
         """Create Kali-optimized wrapper script"""
-        print(f"🔗 Creating command wrapper...")
+        self._log(f"🔗 Creating command wrapper...")
         
         try:
             wrapper_content = f'''#!/bin/bash
@@ -180,97 +231,96 @@ fi
 exec /usr/bin/python3 "$PYTHON_SCRIPT" "$@"
 '''
             
-            with open(self.bin_path, 'w') as f:
-                f.write(wrapper_content)
-            
-            self.bin_path.chmod(0o755)
-            print("✅ Command wrapper created")
+            if _write_executable(self.bin_path, wrapper_content):
+                self._log("✅ Command wrapper created")
+            else:
+                self._log("✅ Command wrapper already up to date")
             return True
             
         except Exception as e:
-            print(f"❌ Failed to create wrapper: {e}")
+            self._log(f"❌ Failed to create wrapper: {e}")
+            return False
+    
+    @_flushes_output
+    def finalize_permissions(self):
+        """Apply permissions (755) to the installed files"""
+        try:
+            _finalize_permissions(self.install_dir)
+            return True
+        except Exception as e:
+            self._log(f"❌ Failed to set permissions: {e}")
             return False
     
+    @_flushes_output
     def configure_tor_for_kali(self):
         """Configure Tor service for Kali Linux"""
-        print("⚙️  Configuring Tor for Kali Linux...")
+        self._log("⚙️  Configuring Tor for Kali Linux...")
         
         try:
-            # Enable and start Tor
-            subprocess.run(['systemctl', 'enable', 'tor'], capture_output=True)
-            subprocess.run(['systemctl', 'start', 'tor'], capture_output=True)
+            # Enable and start Tor; systemctl waits for the start job
+            self._flush()
+            started, error = _enable_and_start_unit('tor')
             
-            # Check status
-            result = subprocess.run(['systemctl', 'is-active', 'tor'], 
-                                  capture_output=True, text=True)
-            
-            if result.stdout.strip() == 'active':
-                print("✅ Tor service configured and running")
+            if started:
+                self._log("✅ Tor service configured and running")
             else:
-                print("⚠️  Tor service status unclear - may need manual start")
-                print("   Try: sudo systemctl start tor")
+                self._log(f"⚠️  Tor service failed to start: {error}")
+                self._log("   Try: sudo systemctl start tor")
             
             return True
             
         except Exception as e:
-            print(f"⚠️  Could not configure Tor: {e}")
-            print("   You may need to start Tor manually: sudo systemctl start tor")
+            self._log(f"⚠️  Could not configure Tor: {e}")
+            self._log("   You may need to start Tor manually: sudo systemctl start tor")
             return True  # Continue anyway
     
+    @_flushes_output
     def test_installation(self):
         """Test the installation"""
-        print("🧪 Testing installation...")
+        self._log("🧪 Testing installation...")
         
-        try:
-            # Test command availability
-            result = subprocess.run([str(self.bin_path), '--help'], 
-                                  capture_output=True, text=True, timeout=10)
-            
-            if result.returncode == 0:
-                print("✅ Installation test passed")
-                return True
-            else:
-                print("⚠️  Installation test had issues")
-                print(f"   Output: {result.stderr}")
-                return True  # Continue anyway
-                
-        except Exception as e:
-            print(f"⚠️  Could not test installation: {e}")
-            return True  # Continue anyway
+        # The wrapper only needs to be executable, no need to launch it
+        if not os.access(self.bin_path, os.X_OK):
+            self._log(f"❌ Command wrapper is not executable: {self.bin_path}")
+            return False
+        
+        self._log("✅ Installation test passed")
+        return True
     
+    @_flushes_output
     def display_kali_completion(self):
         """Display Kali-specific completion message"""
-        print("\n" + "="*60)
-        print("🐲 AnonymityEngine installed successfully on Kali Linux!")
-        print("="*60)
+        self._log("\n" + "="*60)
+        self._log("🐲 AnonymityEngine installed successfully on Kali Linux!")
+        self._log("="*60)
         
-        print(f"\n🚀 Quick Start:")
-        print(f"   {self.command_name}")
+        self._log(f"\n🚀 Quick Start:")
+        self._log(f"   {self.command_name}")
         
-        print(f"\n🔧 Kali-Specific Notes:")
-        print(f"   • Uses system Python packages (no venv conflicts)")
-        print(f"   • Optimized for root user environment")
-        print(f"   • Compatible with Kali's security policies")
+        self._log(f"\n🔧 Kali-Specific Notes:")
+        self._log(f"   • Uses system Python packages (no venv conflicts)")
+        self._log(f"   • Optimized for root user environment")
+        self._log(f"   • Compatible with Kali's security policies")
         
-        print(f"\n🌐 Browser Setup:")
-        print(f"   • Firefox: Preferences → Network → Manual Proxy")
-        print(f"   • SOCKS Host: 127.0.0.1  Port: 9050")
-        print(f"   • Or use: firefox --proxy-server='socks5://127.0.0.1:9050'")
+        self._log(f"\n🌐 Browser Setup:")
+        self._log(f"   • Firefox: Preferences → Network → Manual Proxy")
+        self._log(f"   • SOCKS Host: 127.0.0.1  Port: 9050")
+        self._log(f"   • Or use: firefox --proxy-server='socks5://127.0.0.1:9050'")
         
-        print(f"\n🛠️  Troubleshooting:")
-        print(f"   • Start Tor: sudo systemctl start tor")
-        print(f"   • Check Tor: sudo systemctl status tor")
-        print(f"   • Test proxy: curl --socks5 127.0.0.1:9050 http://checkip.amazonaws.com")
+        self._log(f"\n🛠️  Troubleshooting:")
+        self._log(f"   • Start Tor: sudo systemctl start tor")
+        self._log(f"   • Check Tor: sudo systemctl status tor")
+        self._log(f"   • Test proxy: curl --socks5 127.0.0.1:9050 http://checkip.amazonaws.com")
         
-        print(f"\n📁 Installation Paths:")
-        print(f"   • Main script: {self.install_dir}")
-        print(f"   • Command: {self.bin_path}")
+        self._log(f"\n📁 Installation Paths:")
+        self._log(f"   • Main script: {self.install_dir}")
+        self._log(f"   • Command: {self.bin_path}")
         
-        print(f"\n🗑️  To uninstall:")
-        print(f"   sudo rm -rf {self.install_dir}")
-        print(f"   sudo rm {self.bin_path}")
+        self._log(f"\n🗑️  To uninstall:")
+        self._log(f"   sudo rm -rf {self.install_dir}")
+        self._log(f"   sudo rm {self.bin_path}")
         
-        print("\n🎯 Happy penetration testing!")
+        self._log("\n🎯 Happy penetration testing!")
     
     def install(self):
         """Main installation process for Kali"""
@@ -300,6 +350,10 @@ exec /usr/bin/python3 "$PYTHON_SCRIPT" "$@"
         if not self.create_kali_wrapper():
             return False
         
+        # Set permissions on everything installed in one pass
+        if not self.finalize_permissions():
+            return False
+        
         # Configure Tor
         self.configure_tor_for_kali()
         
@@ -311,44 +365,41 @@ exec /usr/bin/python3 "$PYTHON_SCRIPT" "$@"
         
         return True
     
+    @_flushes_output
     def uninstall(self):
         """Uninstall AnonymityEngine"""
-        print("🗑️  Uninstalling AnonymityEngine...")
+        self._log("🗑️  Uninstalling AnonymityEngine...")
         
         try:
-            import shutil
-            
             if self.bin_path.exists():
                 self.bin_path.unlink()
-                print(f"✅ Removed: {self.bin_path}")
+                self._log(f"✅ Removed: {self.bin_path}")
             
             if self.install_dir.exists():
+                # shutil.rmtree already walks with scandir, and refuses a symlinked root
                 shutil.rmtree(self.install_dir)
-                print(f"✅ Removed: {self.install_dir}")
+                self._log(f"✅ Removed: {self.install_dir}")
             
-            print("✅ AnonymityEngine uninstalled successfully")
+            self._log("✅ AnonymityEngine uninstalled successfully")
             return True
             
         except Exception as e:
-            print(f"❌ Error during uninstallation: {e}")
+            self._log(f"❌ Error during uninstallation: {e}")
             return False
 
-def main():
-    """Main entry point"""
-    installer = KaliInstaller()
-    
-    if len(sys.argv) > 1:
-        if sys.argv[1] in ['-h', '--help']:
-            print("""
+def _print_help(installer):
+    """Show usage information"""
+    print("""
 AnonymityEngine - Kali Linux Installer
 
 Usage:
   sudo python3 kali_install.py [option]
 
 Options:
-  install     Install AnonymityEngine (default)
-  uninstall   Remove AnonymityEngine
-  -h, --help  Show this help message
+  install         Install AnonymityEngine (default)
+  uninstall       Remove AnonymityEngine
+  --force-update  Run apt update even if the package cache is fresh
+  -h, --help      Show this help message
 
 This installer is optimized for:
   • Kali Linux
@@ -360,24 +411,25 @@ Features:
   • Avoids pip conflicts
   • Root-user optimized
   • Penetration testing ready
-            """)
-            return
-        
-        elif sys.argv[1] == 'uninstall':
-            if installer.uninstall():
-                print("\n👋 AnonymityEngine removed successfully!")
-            else:
-                print("\n❌ Uninstallation failed!")
-                sys.exit(1)
-            return
-    
+    """)
+
+def _run_uninstall(installer):
+    """Remove the application"""
+    if installer.uninstall():
+        print("\n👋 AnonymityEngine removed successfully!")
+    else:
+        print("\n❌ Uninstallation failed!")
+        sys.exit(1)
+
+def _run_install(installer):
+    """Install the application (default action)"""
     # Check if running as root
     if os.geteuid() != 0:
         print("❌ This installer must be run with sudo privileges")
         print("   Usage: sudo python3 kali_install.py")
         sys.exit(1)
     
-    # Default action: install
+    # Default action
     try:
         if installer.install():
             print("\n🎉 Installation completed successfully!")
@@ -392,5 +444,22 @@ Features:
         print(f"\n❌ Unexpected error: {e}")
         sys.exit(1)
 
+# Command dispatch table; anything unrecognised falls back to install
+COMMANDS = {
+    'install': _run_install,
+    'uninstall': _run_uninstall,
+    '-h': _print_help,
+    '--help': _print_help,
+}
+
+def main():
+    """Main entry point"""
+    installer = KaliInstaller(force_update='--force-update' in sys.argv)
+    
+    # Parse command line arguments; options such as --force-update may come first
+    command = next((arg for arg in sys.argv[1:] if arg in COMMANDS or not arg.startswith('--')),
+                   'install')
+    COMMANDS.get(command, _run_install)(installer)
+
 if __name__ == "__main__":
     main()